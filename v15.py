@@ -1,127 +1,459 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import yfinance as yf
-import matplotlib.pyplot as plt
+from numba import njit, types
+import bottleneck as bn
+import altair as alt
 import time
+import re
+from pathlib import Path
 import requests
+import orjson
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import queue
+import threading
+from streamlit_autorefresh import st_autorefresh
 
 # ======================
-# 手動計算 EMA 的函數
+# Numba 核心的 float32 型別簽名：帶簽名的核心在載入時即編譯，首次刷新不需等待 JIT
+# (輸入宣告為唯讀，pandas copy-on-write 下 to_numpy() 回傳唯讀視圖)
 # ======================
-def calculate_ema(series, period):
-    alpha = 2 / (period + 1)
-    ema = series.ewm(alpha=alpha, adjust=False).mean()
-    return ema
+_F32 = types.float32[:]
+_F32_IN = types.Array(types.float32, 1, 'A', readonly=True)
+_ONE = np.float32(1.0)
 
 # ======================
-# 手動計算 MACD 的函數
+# EMA 單步遞推 (Numba，內聯進各核心，不單獨編譯)
 # ======================
-def calculate_macd(close, fast=12, slow=26, signal=9):
-    ema_fast = calculate_ema(close, fast)
-    ema_slow = calculate_ema(close, slow)
-    macd_line = ema_fast - ema_slow
-    signal_line = calculate_ema(macd_line, signal)
-    histogram = macd_line - signal_line
-    return macd_line, signal_line, histogram
+@njit(cache=True, inline='always')
+def _ema_step(prev, old_wt, cur, alpha):
+    # 一般情況 y += alpha * (x - y)；缺值期間與 pandas ewm(adjust=False) 相同，舊權重持續衰減
+    if np.isnan(prev):
+        if not np.isnan(cur):
+            prev = cur
+    elif np.isnan(cur):
+        old_wt *= _ONE - alpha
+    elif old_wt == _ONE:
+        prev += alpha * (cur - prev)
+    else:
+        old_wt *= _ONE - alpha
+        prev = (old_wt * prev + alpha * cur) / (old_wt + alpha)
+        old_wt = _ONE
+    return prev, old_wt
 
 # ======================
-# 獲取股票數據 (使用 yfinance)
+# EMA5/10/20 + MACD 單次遍歷
+# seed 為前一根K線的遞推狀態 (EMA5/10/20/12/26、訊號線)，全為 NaN 代表從頭計算
+# ======================
+_INDICATOR_COLUMNS = ('EMA5', 'EMA10', 'EMA20', 'EMA12', 'EMA26', 'MACD', 'MACD_signal', 'MACD_hist')
+_STATE_COLUMNS = ['EMA5', 'EMA10', 'EMA20', 'EMA12', 'EMA26', 'MACD_signal']
+
+_A5, _A10, _A20, _A12, _A26, _A9 = (np.float32(2.0 / (p + 1)) for p in (5, 10, 20, 12, 26, 9))
+
+@njit(cache=True)
+def _fill_indicators(close, seed, out):
+    e5, e10, e20, e12, e26, sig = seed[0], seed[1], seed[2], seed[3], seed[4], seed[5]
+    w5 = w10 = w20 = w12 = w26 = wsig = _ONE
+    for i in range(len(close)):
+        c = close[i]
+        e5, w5 = _ema_step(e5, w5, c, _A5)
+        e10, w10 = _ema_step(e10, w10, c, _A10)
+        e20, w20 = _ema_step(e20, w20, c, _A20)
+        e12, w12 = _ema_step(e12, w12, c, _A12)
+        e26, w26 = _ema_step(e26, w26, c, _A26)
+        m = e12 - e26
+        sig, wsig = _ema_step(sig, wsig, m, _A9)
+        
+        out[0, i] = e5
+        out[1, i] = e10
+        out[2, i] = e20
+        out[3, i] = e12
+        out[4, i] = e26
+        out[5, i] = m
+        out[6, i] = sig
+        out[7, i] = m - sig
+
+# ======================
+# 多個股票一次計算：各股收盤價首尾相接，offsets 標示每段起訖，一次呼叫逐段計算
+# (不使用 parallel：Streamlit 各 session 執行緒會同時呼叫，且數據量小，平行化幾乎沒有收益)
+# ======================
+@njit(types.float32[:, :](_F32_IN, types.int64[:], types.float32[:, :]), cache=True)
+def _all_indicators_batch(close, offsets, seeds):
+    out = np.empty((len(_INDICATOR_COLUMNS), len(close)), dtype=np.float32)
+    for s in range(len(offsets) - 1):
+        a, b = offsets[s], offsets[s + 1]
+        _fill_indicators(close[a:b], seeds[s], out[:, a:b])
+    return out
+
+def _run_indicators_batch(closes, seeds):
+    offsets = np.zeros(len(closes) + 1, dtype=np.int64)
+    np.cumsum([len(close) for close in closes], out=offsets[1:])
+    out = _all_indicators_batch(np.concatenate(closes), offsets, seeds)
+    return [out[:, offsets[j]:offsets[j + 1]] for j in range(len(closes))]
+
+# ======================
+# 阻力位：前 w 根K線最高價 (等同 rolling(w).max().shift(1))，單調佇列 O(N)
+# ======================
+@njit(_F32(_F32_IN, types.int64), cache=True)
+def _rolling_max_shift1(h, w):
+    n = len(h)
+    out = np.full(n, np.nan, dtype=np.float32)
+    buf = np.empty(n, dtype=np.int64)  # 佇列內索引對應的值遞減，隊首為視窗最大值
+    head = tail = 0
+    nan_count = 0
+    for i in range(n):
+        # 視窗 [i-w, i-1]，尚未納入第 i 根，即 shift(1)
+        if i >= w and nan_count == 0:
+            out[i] = h[buf[head]]
+        
+        x = h[i]
+        if np.isnan(x):
+            nan_count += 1
+        else:
+            while tail > head and h[buf[tail - 1]] <= x:
+                tail -= 1
+            buf[tail] = i
+            tail += 1
+        
+        if i >= w:
+            if np.isnan(h[i - w]):
+                nan_count -= 1
+            while head < tail and buf[head] <= i - w:
+                head += 1
+    return out
+
+# ======================
+# 批次獲取所有股票數據 (使用 yfinance，一次請求)
 # ======================
 @st.cache_data(ttl=60)
-def get_stock_data(symbol, period="5d", interval="5m"):
+def get_all_stock_data(symbols, period="5d", interval="5m"):
+    import yfinance as yf  # 延遲載入，縮短冷啟動時間
+    
     try:
-        df = yf.download(symbol, period=period, interval=interval, progress=False)
-        if df.empty:
+        # 日內數據無除權息調整，關閉 auto_adjust 可省去 yfinance 多餘的價格調整
+        raw = yf.download(list(symbols), period=period, interval=interval,
+                          group_by='ticker', threads=True, progress=False,
+                          auto_adjust=False)
+    except Exception as e:
+        st.error(f"下載數據失敗: {e}")
+        return {}
+    
+    data = {}
+    downloaded = set(raw.columns.get_level_values(0)) if not raw.empty else set()
+    for symbol in symbols:
+        df = raw[symbol].dropna(how='all') if symbol in downloaded else None
+        if df is None or df.empty:
             st.error(f"無法獲取 {symbol} 的數據，請檢查代碼或網路")
-            return None
+            continue
         df = df[['Open', 'High', 'Low', 'Close', 'Volume']]
         df.columns = ['open', 'high', 'low', 'close', 'volume']
         df.index.name = 'timestamp'
-        return df
-    except Exception as e:
-        st.error(f"下載數據失敗: {e}")
-        return None
+        data[symbol] = df.astype('float32')
+    return data
 
 # ======================
-# 計算所有指標，包括阻力位
+# 休市時略過重複下載：最後一根K線已過期時，沿用上次結果最多一根K線的時間
+# 每組 (股票, 期間) 各有一個紀錄，同一輪的當日增量與5日完整下載互不覆蓋
 # ======================
-def calculate_indicators(df):
-    if df is None or len(df) < 50:
-        return df
+_BAR_SECONDS = 5 * 60
+
+def load_stock_data(symbols, period="5d"):
+    key = (tuple(sorted(symbols)), period)
+    now = time.time()
+    slots = st.session_state.setdefault('stock_data_slots', {})
+    slot = slots.get(key)
+    if slot and slot['idle'] and now - slot['fetched_at'] < _BAR_SECONDS:
+        return slot['data']
     
-    df = df.copy()
-    df['EMA5']  = calculate_ema(df['close'], 5)
-    df['EMA10'] = calculate_ema(df['close'], 10)
-    df['EMA20'] = calculate_ema(df['close'], 20)
+    data = get_all_stock_data(key[0], period=period)
+    stale_before = pd.Timestamp(now - 2 * _BAR_SECONDS, unit='s', tz='UTC')
+    # 完全沒有數據 (例如代碼錯誤) 也視為閒置，一根K線時間後再重試
+    idle = all(df.index[-1] < stale_before for df in data.values())
+    # 超過一根K線時間的紀錄已不會被沿用，順便清除
+    for old_key in [k for k, v in slots.items() if now - v['fetched_at'] >= _BAR_SECONDS]:
+        del slots[old_key]
+    slots[key] = {'data': data, 'fetched_at': now, 'idle': idle}
+    return data
+
+# ======================
+# 數據版本鍵：最後一根K線時間、收盤價與長度
+# ======================
+def _frame_key(df):
+    return int(df.index[-1].value), float(df['close'].iloc[-1]), len(df)
+
+# ======================
+# 20根K線均量與阻力位 (前20根最高價)
+# ======================
+def _rolling_columns(df):
+    avg_volume = bn.move_mean(df['volume'].to_numpy(dtype=np.float32), window=20, min_count=20)
+    resistance = _rolling_max_shift1(df['high'].to_numpy(dtype=np.float32), 20)
+    return avg_volume, resistance
+
+# ======================
+# 買賣條件，整段數據一次向量化計算
+# -1 無信號；0 反轉買入、1 突破買入、2 下跌賣出、3 突破失敗
+# prev 為前一根K線的 (收盤價, 訊號線)；沒有前值時第一根不會觸發
+# ======================
+def _signal_kinds(close, ema5, ema10, macd, macd_sig, vol, avg_vol, resistance, prev=None):
+    prev_close = np.empty_like(close)
+    prev_macd_sig = np.empty_like(macd_sig)
+    prev_close[1:] = close[:-1]
+    prev_macd_sig[1:] = macd_sig[:-1]
+    prev_close[:1], prev_macd_sig[:1] = prev if prev is not None else (np.nan, np.nan)
+    vol_surge = vol > avg_vol * 1.2
     
-    df['MACD'], df['MACD_signal'], df['MACD_hist'] = calculate_macd(df['close'])
+    buy1 = (close > ema5) & (ema5 > ema10) & (macd > macd_sig) & (macd_sig > prev_macd_sig) & vol_surge
+    buy2 = (close > resistance) & (resistance > prev_close) & vol_surge & (macd > 0)
+    sell1 = (close < ema5) & (ema5 < ema10) & (macd < macd_sig) & (macd_sig < prev_macd_sig) & vol_surge
+    sell2 = (close < resistance) & (resistance < prev_close) & (macd < 0)
+    return np.select([buy1, buy2, sell1, sell2], [0, 1, 2, 3], default=-1).astype(np.int8)
+
+# ======================
+# 將指標欄位附加到單一股票的 DataFrame，包括阻力位與信號類型
+# ======================
+def _assign_indicators(df, out, avg_volume, resistance, prev=None):
+    columns = dict(zip(_INDICATOR_COLUMNS, out))
+    signal = _signal_kinds(df['close'].to_numpy(), columns['EMA5'], columns['EMA10'], columns['MACD'],
+                           columns['MACD_signal'], df['volume'].to_numpy(), avg_volume, resistance, prev)
+    # 先組成一個只含指標欄位的 DataFrame (float32 區塊 + int8 信號欄)，再與原始數據並排
+    indicators = pd.DataFrame(
+        {**columns, 'avg_volume': avg_volume, 'resistance': resistance, 'signal': signal},
+        index=df.index,
+    )
+    return pd.concat([df, indicators], axis=1)
+
+# ======================
+# 計算所有股票的指標 (一次批次)
+# (以各股數據版本鍵快取，DataFrame 本身不參與雜湊)
+# ======================
+@st.cache_data(ttl=60, show_spinner=False)
+def calculate_indicators(_data, frame_keys):
+    result = {symbol: df for symbol, df in _data.items() if len(df) < 50}
+    ready = [symbol for symbol, df in _data.items() if len(df) >= 50]
+    if not ready:
+        return result
     
-    df['avg_volume'] = df['volume'].rolling(window=20).mean()
+    seeds = np.full((len(ready), len(_STATE_COLUMNS)), np.nan, dtype=np.float32)
+    outs = _run_indicators_batch([_data[symbol]['close'].to_numpy(dtype=np.float32) for symbol in ready], seeds)
+    for symbol, out in zip(ready, outs):
+        df = _data[symbol]
+        result[symbol] = _assign_indicators(df, out, *_rolling_columns(df))
+    return result
+
+# ======================
+# 增量更新指標：只重算上一輪最後一根 (可能仍在變動) 之後的K線
+# 遞推從前一根K線的狀態接續；與舊數據沒有重疊的股票不在回傳結果中，需完整重算
+# ======================
+def extend_indicators(frames, recent):
+    result = {}
+    plans = []
+    for symbol, new in recent.items():
+        old = frames.get(symbol)
+        if old is None or 'EMA5' not in old or new.index[0] > old.index[-1]:
+            continue
+        tail = new[new.index >= old.index[-1]]
+        if tail.empty:
+            result[symbol] = old
+            continue
+        keep = old[old.index < tail.index[0]]
+        # 接續點收盤價為缺值時，遞推權重仍在衰減中，種子無法還原，改為完整重算
+        if keep.empty or np.isnan(keep['close'].iloc[-1]):
+            continue
+        plans.append((symbol, old, keep, tail))
+    if not plans:
+        return result
     
-    df['resistance'] = df['high'].rolling(window=20).max().shift(1)
+    seeds = np.stack([keep[_STATE_COLUMNS].iloc[-1].to_numpy(dtype=np.float32) for _, _, keep, _ in plans])
+    outs = _run_indicators_batch([tail['close'].to_numpy(dtype=np.float32) for _, _, _, tail in plans], seeds)
+    for (symbol, old, keep, tail), out in zip(plans, outs):
+        # 滾動欄位只需新K線前20根作為上下文
+        context = pd.concat([keep[tail.columns].iloc[-20:], tail])
+        avg_volume, resistance = _rolling_columns(context)
+        n = len(tail)
+        prev = keep['close'].iloc[-1], keep['MACD_signal'].iloc[-1]
+        tail_ind = _assign_indicators(tail, out, avg_volume[-n:], resistance[-n:], prev)
+        result[symbol] = pd.concat([keep, tail_ind]).iloc[-len(old):]
+    return result
+
+# ======================
+# 指標本地快取 (parquet，每個股票一檔)：重新啟動後先接續上次結果，只需增量補上新K線
+# 預設關閉，於 secrets 設定 INDICATOR_CACHE = true 啟用
+# 快取可有可無，讀寫失敗或欄位格式不符時一律當作沒有快取
+# ======================
+_CACHE_DIR = Path("cache")
+_FRAME_DTYPES = {
+    **dict.fromkeys(['open', 'high', 'low', 'close', 'volume', *_INDICATOR_COLUMNS, 'avg_volume', 'resistance'],
+                    np.dtype(np.float32)),
+    'signal': np.dtype(np.int8),
+}
+_CACHEABLE_SYMBOL = re.compile(r"[A-Z0-9.^=-]+")
+
+def _cache_path(symbol):
+    # 代碼來自輸入框，只接受正常的股票代碼字元作為檔名，避免路徑跳出快取目錄
+    return _CACHE_DIR / f"{symbol}.parquet" if _CACHEABLE_SYMBOL.fullmatch(symbol) else None
+
+def _load_cached_frames(symbols):
+    frames = {}
+    for symbol in symbols:
+        path = _cache_path(symbol)
+        if path is None:
+            continue
+        try:
+            df = pd.read_parquet(path)
+        except (OSError, ValueError):
+            continue
+        # 舊版或其他格式的檔案不採用，之後會被新結果覆蓋
+        if (isinstance(df.index, pd.DatetimeIndex) and list(df.columns) == list(_FRAME_DTYPES)
+                and df.dtypes.to_dict() == _FRAME_DTYPES):
+            frames[symbol] = df
+    return frames
+
+def _store_cached_frames(frames):
+    paths = [(_cache_path(symbol), df) for symbol, df in frames.items()]
+    paths = [(path, df) for path, df in paths if path is not None]
+    if not paths:
+        return
+    try:
+        _CACHE_DIR.mkdir(exist_ok=True)
+        for path, df in paths:
+            df.to_parquet(path)
+    except (OSError, ValueError):
+        pass
+
+# ======================
+# 每輪刷新的指標來源：已有狀態 (本 session 或本地快取) 的股票只下載當日數據增量更新，其餘完整下載5日數據
+# ======================
+def load_indicators(symbols, disk_cache=False):
+    frames = st.session_state.setdefault('indicator_frames', {})
+    if disk_cache:
+        frames.update(_load_cached_frames([symbol for symbol in symbols if symbol not in frames]))
+    fresh = {}
+    known = [symbol for symbol in symbols if symbol in frames and 'EMA5' in frames[symbol]]
+    if known:
+        fresh.update(extend_indicators(frames, load_stock_data(known, period="1d")))
+    
+    missing = [symbol for symbol in symbols if symbol not in fresh]
+    if missing:
+        data = load_stock_data(missing)
+        frame_keys = tuple(sorted((symbol, _frame_key(df)) for symbol, df in data.items()))
+        fresh.update(calculate_indicators(data, frame_keys))
     
-    return df
+    if disk_cache:
+        changed = {symbol: df for symbol, df in fresh.items()
+                   if 'EMA5' in df and (symbol not in frames or _frame_key(frames[symbol]) != _frame_key(df))}
+        _store_cached_frames(changed)
+    frames.update(fresh)
+    return fresh
 
 # ======================
 # 產生買賣信號
 # ======================
+# 訊息模板，依信號類型 (kind) 索引
+_SIGNAL_TEMPLATES = (
+    "**買入信號 (EMA/MACD反轉)** @ {close:.2f}  (時間: {ts}) | 建議買入10股，止損: {stop_loss:.2f}",
+    "**買入信號 (突破阻力)** @ {close:.2f}  (時間: {ts}) | 建議買入10股，止損: {stop_loss:.2f}，目標: {target:.2f}",
+    "**賣出信號 (EMA/MACD下跌)** @ {close:.2f}  (時間: {ts}) | 建議賣出10股，止損: {stop_loss:.2f}",
+    "**賣出信號 (突破失敗)** @ {close:.2f}  (時間: {ts}) | 建議賣出10股，止損: {stop_loss:.2f}",
+)
+
 def generate_signals(df):
     if df is None or len(df) < 30:
         return []
     
+    close = df['close'].to_numpy()
+    resistance = df['resistance'].to_numpy()
+    high = df['high'].to_numpy()
+    low = df['low'].to_numpy()
+    kind = df['signal'].to_numpy()
+    
+    # 最近11根K線的低點/高點，一次預先算好
+    stop_loss_buy = bn.move_min(low, window=11, min_count=1) * 0.98
+    stop_loss_sell = bn.move_max(high, window=11, min_count=1) * 1.02
+    
+    # 只對最後五個信號格式化；以 (信號類型, K線時間) 作為去重鍵
+    hits = np.flatnonzero(kind >= 0)[-5:]
     signals = []
-    for i in range(1, len(df)):
-        row = df.iloc[i]
-        prev = df.iloc[i-1]
-        
-        close = row['close']
-        ema5 = row['EMA5']
-        ema10 = row['EMA10']
-        macd = row['MACD']
-        macd_sig = row['MACD_signal']
-        vol = row['volume']
-        avg_vol = row['avg_volume']
-        resistance = row['resistance']
-        
-        if (close > ema5 > ema10) and (macd > macd_sig > prev['MACD_signal']) and (vol > avg_vol * 1.2):
-            recent_low = df['low'].iloc[max(0, i-10):i+1].min()
-            stop_loss = recent_low * 0.98
-            signals.append(f"**買入信號 (EMA/MACD反轉)** @ {close:.2f}  (時間: {df.index[i]}) | 建議買入10股，止損: {stop_loss:.2f}")
-        
-        elif (close > resistance > prev['close']) and (vol > avg_vol * 1.2) and (macd > 0):
-            recent_low = df['low'].iloc[max(0, i-10):i+1].min()
-            stop_loss = recent_low * 0.98
-            next_target = resistance * 1.02
-            signals.append(f"**買入信號 (突破阻力)** @ {close:.2f}  (時間: {df.index[i]}) | 建議買入10股，止損: {stop_loss:.2f}，目標: {next_target:.2f}")
-        
-        elif (close < ema5 < ema10) and (macd < macd_sig < prev['MACD_signal']) and (vol > avg_vol * 1.2):
-            recent_high = df['high'].iloc[max(0, i-10):i+1].max()
-            stop_loss = recent_high * 1.02
-            signals.append(f"**賣出信號 (EMA/MACD下跌)** @ {close:.2f}  (時間: {df.index[i]}) | 建議賣出10股，止損: {stop_loss:.2f}")
-        
-        elif (close < resistance < prev['close']) and (macd < 0):
-            recent_high = df['high'].iloc[max(0, i-10):i+1].max()
-            stop_loss = recent_high * 1.02
-            signals.append(f"**賣出信號 (突破失敗)** @ {close:.2f}  (時間: {df.index[i]}) | 建議賣出10股，止損: {stop_loss:.2f}")
+    for i, ts in zip(hits, df.index[hits]):
+        k = kind[i]
+        stop_loss = stop_loss_buy[i] if k < 2 else stop_loss_sell[i]
+        text = _SIGNAL_TEMPLATES[k].format(close=close[i], ts=ts, stop_loss=stop_loss, target=resistance[i] * 1.02)
+        signals.append(((int(k), ts.value), text))
     
-    return signals[-5:]
+    return signals
 
 # ======================
-# 使用 requests 發送 Telegram 訊息
+# 繪製價格/MACD 圖表 (Altair，於瀏覽器端繪製)
 # ======================
-def send_telegram_message(bot_token, chat_id, text):
-    if not bot_token or not chat_id:
-        return False, "Telegram 配置缺失"
+_PRICE_SERIES = {'close': 'black', 'EMA5': '#1f77b4', 'EMA10': '#ff7f0e', 'EMA20': '#2ca02c', 'resistance': 'red'}
+_MACD_SERIES = {'MACD': '#1f77b4', 'MACD_signal': '#ff7f0e'}
+
+def render_chart(symbol, df_ind):
+    data = df_ind[[*_PRICE_SERIES, *_MACD_SERIES, 'MACD_hist']].reset_index()
+    base = alt.Chart(data).encode(x=alt.X('timestamp:T', title=None))
+    
+    price = base.transform_fold(list(_PRICE_SERIES), as_=['series', 'value']).mark_line().encode(
+        y=alt.Y('value:Q', title='價格', scale=alt.Scale(zero=False)),
+        color=alt.Color('series:N', title=None,
+                        scale=alt.Scale(domain=list(_PRICE_SERIES), range=list(_PRICE_SERIES.values()))),
+        strokeDash=alt.condition(alt.datum.series == 'resistance', alt.value([5, 3]), alt.value([1, 0])),
+    ).properties(title=f"{symbol} 價格、EMA與阻力位", height=350)
+    
+    hist = base.mark_bar(opacity=0.6).encode(
+        y=alt.Y('MACD_hist:Q', title='MACD 值'),
+        color=alt.condition(alt.datum.MACD_hist >= 0, alt.value('green'), alt.value('red')),
+    )
+    macd = base.transform_fold(list(_MACD_SERIES), as_=['series', 'value']).mark_line().encode(
+        y='value:Q',
+        color=alt.Color('series:N', title=None,
+                        scale=alt.Scale(domain=list(_MACD_SERIES), range=list(_MACD_SERIES.values()))),
+    )
+    zero = alt.Chart(pd.DataFrame({'y': [0]})).mark_rule(color='black', strokeDash=[4, 4]).encode(y='y:Q')
     
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {
-        "chat_id": chat_id,
-        "text": text,
-        "parse_mode": "Markdown"
+    return alt.vconcat(
+        price,
+        alt.layer(hist, macd, zero).properties(title="MACD", height=120),
+    ).resolve_scale(color='independent')
+
+# ======================
+# 組裝單一分頁內容；數據版本未變時直接沿用上一輪結果
+# ======================
+def build_tab(symbol, df_ind, key):
+    tab_cache = st.session_state.setdefault('tab_cache', {})
+    cached = tab_cache.get(symbol)
+    if cached is not None and cached['key'] == key:
+        return cached
+    
+    tab = {
+        'key': key,
+        'table': df_ind.tail(8)[['close','EMA5','EMA10','EMA20','MACD','MACD_signal','MACD_hist','volume', 'resistance']]
+                 .style.format("{:.2f}"),
+        'chart': render_chart(symbol, df_ind),
+        'signals': generate_signals(df_ind),
+    }
+    tab_cache[symbol] = tab
+    return tab
+
+# ======================
+# Telegram 連線、網址與背景執行緒 (依憑證快取，跨 rerun 共用)
+# 單一 daemon 執行緒依序消化佇列，每則訊息各發送一次
+# ======================
+@st.cache_resource
+def _telegram_client(bot_token, chat_id):
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    client = {
+        "session": session,
+        "url": f"https://api.telegram.org/bot{bot_token}/sendMessage",
+        "payload": {"chat_id": chat_id, "parse_mode": "Markdown"},
+        "outbox": queue.Queue(),
     }
+    threading.Thread(target=_telegram_worker, args=(client,), daemon=True).start()
+    return client
+
+def _post_telegram(session, url, payload):
     try:
-        response = requests.post(url, json=payload, timeout=10)
+        response = session.post(url, data=orjson.dumps(payload), timeout=10)
         if response.status_code == 200:
             return True, "發送成功"
         else:
@@ -129,6 +461,39 @@ def send_telegram_message(bot_token, chat_id, text):
     except Exception as e:
         return False, f"發送失敗: {str(e)}"
 
+def _telegram_worker(client):
+    outbox = client["outbox"]
+    while True:
+        text, future = outbox.get()
+        payload = {**client["payload"], "text": text}
+        future.set_result(_post_telegram(client["session"], client["url"], payload))
+
+# ======================
+# 發送 Telegram 訊息 (放入背景佇列，回傳 Future)
+# ======================
+def send_telegram_message(bot_token, chat_id, text):
+    future = Future()
+    if not bot_token or not chat_id:
+        future.set_result((False, "Telegram 配置缺失"))
+        return future
+    
+    _telegram_client(bot_token, chat_id)["outbox"].put((text, future))
+    return future
+
+# ======================
+# 已發送信號紀錄：容量固定，超過時淘汰最舊的項目
+# ======================
+class _SignalTracker(OrderedDict):
+    def __init__(self, cap=1024):
+        super().__init__()
+        self.cap = cap
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.cap:
+            self.popitem(last=False)
+
 # ======================
 # Streamlit 主程式
 # ======================
@@ -136,89 +501,78 @@ st.title("實時股票監控與買賣建議App（整合突破阻力策略）")
 st.markdown("基於EMA、MACD、成交量及突破阻力位，實時監控並給出建議。每60秒自動更新。")
 
 symbols_input = st.text_input("輸入股票代碼，用逗號分隔", value="TSLA").upper().strip()
-symbols = [s.strip() for s in symbols_input.split(',') if s.strip()]
+# 去除重複代碼並保留輸入順序 (分頁依此排列；下載快取鍵另以排序後的 tuple 表示)
+symbols = list(dict.fromkeys(s.strip() for s in symbols_input.split(',') if s.strip()))
 auto_refresh = st.checkbox("自動刷新（每60秒）", value=True)
 
-# 從 secrets 讀取 Telegram 設定
+# 由前端計時器觸發重跑，伺服器執行緒不再 sleep 佔用
+if auto_refresh:
+    st_autorefresh(interval=60_000, key="tick")
+
+# 從 secrets 讀取 Telegram 與本地快取設定
 TELEGRAM_BOT_TOKEN = st.secrets.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = st.secrets.get("TELEGRAM_CHAT_ID", "")
+INDICATOR_CACHE = bool(st.secrets.get("INDICATOR_CACHE", False))
 
 if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
     st.warning("Telegram Bot Token 或 Chat ID 未在 secrets 中設定，通知功能將禁用。")
 
-# 安全同步 sent_signals
+# 安全同步 sent_signals：以 (股票, 信號鍵) 為鍵的有上限 LRU
 if 'sent_signals' not in st.session_state:
-    st.session_state.sent_signals = {}
-
-for symbol in symbols:
-    if symbol not in st.session_state.sent_signals:
-        st.session_state.sent_signals[symbol] = []
-
-placeholder = st.empty()
-
-while True:
-    with placeholder.container():
-        if symbols:
-            tabs = st.tabs(symbols)
-            for idx, symbol in enumerate(symbols):
-                with tabs[idx]:
-                    df = get_stock_data(symbol)
-                    if df is not None:
-                        df_ind = calculate_indicators(df)
-                        
-                        with st.expander(f"最新數據 - {symbol} (5分鐘K線)", expanded=True):
-                            st.dataframe(
-                                df_ind.tail(8)[['close','EMA5','EMA10','EMA20','MACD','MACD_signal','MACD_hist','volume', 'resistance']]
-                                .style.format("{:.2f}")
-                            )
-                        
-                        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 7), sharex=True, gridspec_kw={'height_ratios': [3, 1]})
-                        
-                        ax1.plot(df_ind.index, df_ind['close'], label='Close', color='black', linewidth=1.2)
-                        ax1.plot(df_ind.index, df_ind['EMA5'], label='EMA5', color='#1f77b4')
-                        ax1.plot(df_ind.index, df_ind['EMA10'], label='EMA10', color='#ff7f0e')
-                        ax1.plot(df_ind.index, df_ind['EMA20'], label='EMA20', color='#2ca02c')
-                        ax1.plot(df_ind.index, df_ind['resistance'], label='Resistance', color='red', linestyle='--')
-                        ax1.legend(loc='upper left')
-                        ax1.set_title(f"{symbol} 價格、EMA與阻力位")
-                        ax1.grid(True, alpha=0.3)
-                        ax1.set_ylabel('價格')
-                        
-                        ax2.plot(df_ind.index, df_ind['MACD'], label='MACD', color='#1f77b4')
-                        ax2.plot(df_ind.index, df_ind['MACD_signal'], label='Signal', color='#ff7f0e')
-                        ax2.bar(df_ind.index, df_ind['MACD_hist'], 
-                                color=np.where(df_ind['MACD_hist'] >= 0, 'green', 'red'), alpha=0.6)
-                        ax2.axhline(0, color='black', linestyle='--', linewidth=0.8)
-                        ax2.legend(loc='upper left')
-                        ax2.set_title("MACD")
-                        ax2.grid(True, alpha=0.3)
-                        ax2.set_ylabel('MACD 值')
-                        
-                        st.pyplot(fig)
-                        
-                        st.subheader("最新買賣信號")
-                        signals = generate_signals(df_ind)
-                        if signals:
-                            for sig in signals:
-                                full_sig = f"[{symbol}] {sig}"
-                                if full_sig not in st.session_state.sent_signals[symbol]:
-                                    if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
-                                        success, msg = send_telegram_message(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, full_sig)
-                                        if success:
-                                            st.session_state.sent_signals[symbol].append(full_sig)
-                                        else:
-                                            st.error(f"Telegram 通知失敗 ({symbol}): {msg}")
-                                if "買入" in sig:
-                                    st.success(full_sig)
-                                else:
-                                    st.warning(full_sig)
+    st.session_state.sent_signals = _SignalTracker(2048)
+
+# 移除已不在監控清單中的股票，避免 session 狀態無限增長
+for cache_name in ('tab_cache', 'indicator_frames'):
+    cache = st.session_state.get(cache_name, {})
+    for symbol in [s for s in cache if s not in symbols]:
+        del cache[symbol]
+
+# 上一輪送出的 Telegram 訊息：失敗者移出已發送清單，下次重試
+if 'pending_telegram' not in st.session_state:
+    st.session_state.pending_telegram = deque()
+
+pending = st.session_state.pending_telegram
+for _ in range(len(pending)):
+    symbol, key, future = pending.popleft()
+    if not future.done():
+        pending.append((symbol, key, future))
+        continue
+    success, msg = future.result()
+    if not success:
+        st.session_state.sent_signals.pop((symbol, key), None)
+        st.error(f"Telegram 通知失敗 ({symbol}): {msg}")
+
+if symbols:
+    all_ind = load_indicators(symbols, disk_cache=INDICATOR_CACHE)
+    tabs = st.tabs(symbols)
+    for idx, symbol in enumerate(symbols):
+        with tabs[idx]:
+            df_ind = all_ind.get(symbol)
+            if df_ind is not None:
+                tab = build_tab(symbol, df_ind, _frame_key(df_ind))
+                
+                with st.expander(f"最新數據 - {symbol} (5分鐘K線)", expanded=True):
+                    st.dataframe(tab['table'])
+                
+                st.altair_chart(tab['chart'])
+                
+                st.subheader("最新買賣信號")
+                signals = tab['signals']
+                if signals:
+                    sent = st.session_state.sent_signals
+                    for key, sig in signals:
+                        full_sig = f"[{symbol}] {sig}"
+                        if (symbol, key) in sent:
+                            sent.move_to_end((symbol, key))
+                        elif TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID:
+                            future = send_telegram_message(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID, full_sig)
+                            sent[(symbol, key)] = None
+                            pending.append((symbol, key, future))
+                        if "買入" in sig:
+                            st.success(full_sig)
                         else:
-                            st.info("目前無明確買賣信號")
-        else:
-            st.info("請輸入至少一個股票代碼")
-    
-    if not auto_refresh:
-        break
-    
-    time.sleep(60)
-    st.rerun()
+                            st.warning(full_sig)
+                else:
+                    st.info("目前無明確買賣信號")
+else:
+    st.info("請輸入至少一個股票代碼")